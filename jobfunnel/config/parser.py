@@ -245,7 +245,8 @@ def parse_config():
 
     # load the default settings
     default_yaml_path = os.path.join(jobfunnel_path, 'config/settings.yaml')
-    default_yaml = yaml.safe_load(open(default_yaml_path, 'r'))
+    with open(default_yaml_path, 'r') as yaml_file:
+        default_yaml = yaml.safe_load(yaml_file)
 
     # parse the command line arguments
     cli = parse_cli()
@@ -256,7 +257,8 @@ def parse_config():
     given_yaml_path = None
     if cli.settings is not None:
         given_yaml_path = os.path.dirname(cli.settings)
-        given_yaml = yaml.safe_load(open(cli.settings, 'r'))
+        with open(cli.settings, 'r') as yaml_file:
+            given_yaml = yaml.safe_load(yaml_file)
 
     # combine default, given and argument yamls into one. Note that we update
     # the values of the default_yaml, so we use this for the rest of the file.
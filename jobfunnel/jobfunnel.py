@@ -49,6 +49,8 @@ class JobFunnel(object):
         self.loglevel = args['log_level']
         self.pickles_dir = args['data_path']
         self.duplicate_list_path = args['duplicate_list_path']
+        self.tfidf_cache_path = os.path.join(args['data_path'],
+                                             'tfidf_cache.pkl')
 
         # other inits
         self.filterlist = None
@@ -148,7 +150,8 @@ class JobFunnel(object):
         pickle_filepath = os.path.join(args['data_path'],
                                        f'jobs_{self.date_string}.pkl')
         try:
-            self.scrape_data = pickle.load(open(pickle_filepath, 'rb'))
+            with open(pickle_filepath, 'rb') as pickle_file:
+                self.scrape_data = pickle.load(pickle_file)
         except FileNotFoundError as e:
             logging.error(f'{pickle_filepath} not found! Have you scraped '
                           f'any jobs today?')
@@ -167,8 +170,8 @@ class JobFunnel(object):
                     pickle_file = file
                     pickle_filepath = os.path.join(pickle_path, pickle_file)
                     logging.info(f'loading pickle file: {pickle_filepath}')
-                    self.scrape_data.update(
-                        pickle.load(open(pickle_filepath, 'rb')))
+                    with open(pickle_filepath, 'rb') as pickle_file:
+                        self.scrape_data.update(pickle.load(pickle_file))
         if not pickle_found:
             logging.error(f'no pickles found in {pickle_path}!'
                           f' Have you scraped any jobs?')
@@ -177,8 +180,9 @@ class JobFunnel(object):
     def dump_pickle(self):
         """function to dump a pickle of the daily scrape dict"""
         pickle_name = f'jobs_{self.date_string}.pkl'
-        pickle.dump(self.scrape_data,
-                    open(os.path.join(self.pickles_dir, pickle_name), 'wb'))
+        with open(os.path.join(self.pickles_dir, pickle_name),
+                  'wb') as pickle_file:
+            pickle.dump(self.scrape_data, pickle_file)
 
     def read_csv(self, path, key_by_id=True):
         # reads csv passed in as path
@@ -197,13 +201,24 @@ class JobFunnel(object):
             for row in data:
                 writer.writerow(data[row])
 
+    def append_csv(self, data, path, fieldnames=MASTERLIST_HEADER):
+        # appends data [dict(),..] to a csv at path, adding a header if new
+        write_header = not os.path.isfile(path)
+        with open(path, 'a', encoding='utf8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            if write_header:
+                writer.writeheader()
+            for row in data:
+                writer.writerow(data[row])
+
     def remove_jobs_in_filterlist(self, data: Dict[str, dict]):
         # load the filter-list if it exists, apply it to remove scraped jobs
         if data == {}:
             raise ValueError('No scraped job data to filter')
 
         if os.path.isfile(self.filterlist_path):
-            self.filterlist = json.load(open(self.filterlist_path, 'r'))
+            with open(self.filterlist_path, 'r', encoding='utf8') as infile:
+                self.filterlist = json.load(infile)
             n_filtered = 0
             for jobid in self.filterlist:
                 if jobid in data:
@@ -234,7 +249,9 @@ class JobFunnel(object):
         if os.path.isfile(self.master_list_path):
             # load existing filtered jobs, if any
             if os.path.isfile(self.filterlist_path):
-                filtered_jobs = json.load(open(self.filterlist_path, 'r'))
+                with open(self.filterlist_path, 'r',
+                          encoding='utf8') as infile:
+                    filtered_jobs = json.load(infile)
             else:
                 filtered_jobs = {}
 
@@ -246,15 +263,11 @@ class JobFunnel(object):
                             job['id'], self.filterlist_path))
                     filtered_jobs[job['id']] = job
 
-            # write out complete list with any additions from the masterlist
+            # write out complete list with any additions from the masterlist,
+            # compact since the filter-list is only read back by jobfunnel
             with open(self.filterlist_path, 'w', encoding='utf8') as outfile:
-                outfile.write(
-                    json.dumps(
-                        filtered_jobs,
-                        indent=4,
-                        sort_keys=True,
-                        separators=(',', ': '),
-                        ensure_ascii=False))
+                json.dump(filtered_jobs, outfile, separators=(',', ':'),
+                          ensure_ascii=False)
 
             # update class attribute
             self.filterlist = filtered_jobs
@@ -344,25 +357,31 @@ class JobFunnel(object):
             # update masterlist to contain only new (unique) listings
             if self.save_dup:  # if true, saves duplicates to own file
                 # calls tfidf filter and returns popped duplicate list
-                duplicate_list = tfidf_filter(self.scrape_data, masterlist)
+                duplicate_list = tfidf_filter(self.scrape_data, masterlist,
+                                              cache_path=self.tfidf_cache_path)
 
                 logging.info(f'Saving {len(duplicate_list)} duplicates jobs to'
                              f' {self.duplicate_list_path}')
                 # checks if duplicate list has entries
                 if len(duplicate_list) > 0:
-                    # checks if duplicate_list.csv exists
+                    # the whole saved list is read to find re-detected
+                    # duplicates, only the write is limited to new ones
+                    saved_dup = {}
                     if os.path.isfile(self.duplicate_list_path):
-                        # loads and adds current duplicates to list
-                        master_dup = self.read_csv(self.duplicate_list_path)
-                        master_dup.update(duplicate_list)
-                        self.write_csv(data=master_dup,
+                        saved_dup = self.read_csv(self.duplicate_list_path)
+                    if saved_dup.keys() & duplicate_list.keys():
+                        # re-detected duplicates (i.e. when re-running without
+                        # a scrape) replace their saved row with the newer one
+                        saved_dup.update(duplicate_list)
+                        self.write_csv(data=saved_dup,
                                        path=self.duplicate_list_path)
                     else:
-                        # saves duplicates to duplicates_list.csv
-                        self.write_csv(data=duplicate_list,
-                                       path=self.duplicate_list_path)
+                        # only new duplicates, so each is appended once
+                        self.append_csv(data=duplicate_list,
+                                        path=self.duplicate_list_path)
             else:
-                tfidf_filter(self.scrape_data, masterlist)
+                tfidf_filter(self.scrape_data, masterlist,
+                             cache_path=self.tfidf_cache_path)
 
             masterlist.update(self.scrape_data)
 
@@ -1,10 +1,24 @@
-import nltk
+import hashlib
 import logging
+import os
+import pickle
 from datetime import datetime, date, timedelta
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import Dict, Optional
-from numpy import delete as np_delete, max as np_max, fill_diagonal
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# nltk, numpy, scipy and sklearn are imported where they are used, so that
+# importing jobfunnel does not pay for them unless tfidf filtering runs
+
+# number of queries whose dense similarities are held in memory at once
+SIMILARITY_BLOCK_SIZE = 512
+
+# similarities are computed in float32, whose rounding can leave exact ties
+# (e.g. identical blurbs) up to ~2e-6 below max_similarity, so jobs within
+# this tolerance of max_similarity are still duplicates
+SIMILARITY_TOLERANCE = 1e-5
+
+# bump when the contents of the tfidf cache change, to invalidate old caches
+TFIDF_CACHE_VERSION = 5
 
 
 def date_filter(cur_dict: Dict[str, dict], number_of_days: int):
@@ -41,8 +55,8 @@ def id_filter(cur_dict: Dict[str, dict], prev_dict: Dict[str, dict], provider):
     """
     # get job ids from scrape and master list by provider as lists
     cur_job_ids = [job['id'] for job in cur_dict.values()]
-    prev_job_ids = [job['id'] for job in prev_dict.values()
-                    if job['provider'] == provider]
+    prev_job_ids = frozenset(job['id'] for job in prev_dict.values()
+                             if job['provider'] == provider)
 
     # pop duplicate job ids from current scrape
     duplicate_ids = [cur_dict.pop(job_id)['id'] for job_id in cur_job_ids
@@ -53,95 +67,392 @@ def id_filter(cur_dict: Dict[str, dict], prev_dict: Dict[str, dict], provider):
                  f'{len(duplicate_ids)} duplicates from {provider}')
 
 
+@lru_cache(maxsize=1)
+def _get_stopwords() -> FrozenSet[str]:
+    """ Get the english stopwords, downloading them if not already present.
+        Cached since reading the nltk corpus allocates a new list every time.
+    """
+    import nltk
+
+    try:
+        return frozenset(nltk.corpus.stopwords.words('english'))
+    except LookupError:
+        nltk.download('stopwords', quiet=True)
+        return frozenset(nltk.corpus.stopwords.words('english'))
+
+
+@lru_cache(maxsize=None)
+def _blurb_analyzer(stopwords: FrozenSet[str]):
+    """ Build the word analyzer used to tokenize job blurbs.
+
+        Args:
+            stopwords: words to drop from the tokenized blurbs
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(strip_accents='unicode', lowercase=True,
+                             analyzer='word',
+                             stop_words=list(stopwords)).build_analyzer()
+
+
+def _blurb_hasher(stopwords: FrozenSet[str]):
+    """ Build the vectorizer that hashes blurbs to term counts, so no
+        vocabulary needs to be held in memory. float32 halves the memory
+        traffic, its rounding is covered by SIMILARITY_TOLERANCE.
+
+        Args:
+            stopwords: words to drop from the tokenized blurbs
+    """
+    from numpy import float32
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(
+        analyzer=_blurb_analyzer(stopwords), n_features=2 ** 18,
+        alternate_sign=False, norm=None, dtype=float32)
+
+
+def _ids_and_blurbs(jobs: Dict[str, dict]) -> Tuple[List[str], List[str]]:
+    """ Get the ids and blurbs of all jobs, in a single pass.
+        Jobs without a blurb are kept, they can never be similar to another
+        job but still count as documents in the idf weights.
+
+        Args:
+            jobs: job dict to get the ids and blurbs from
+
+        Returns:
+            list of job ids, list of blurbs
+    """
+    ids, blurbs = [], []
+    for job in jobs.values():
+        ids.append(job['id'])
+        blurbs.append(job['blurb'])
+    return ids, blurbs
+
+
+@lru_cache(maxsize=1)
+def _load_sp_matmul_topn():
+    """ Import sp_matmul_topn from sparse_dot_topn, which is optional and
+        speeds up similarity of large master lists. None if not installed.
+    """
+    try:
+        from sparse_dot_topn import sp_matmul_topn
+    except ImportError:
+        return None
+    return sp_matmul_topn
+
+
+def _blurb_digest(blurb: str) -> str:
+    """ Digest of a job blurb, to tell if the blurb of a job id changed."""
+    return hashlib.sha1(blurb.encode('utf8')).hexdigest()
+
+
+def _max_similarities(queries, postings):
+    """ Get the highest cosine similarity of each query to any reference.
+
+        If sparse_dot_topn is installed, only the best match of each query is
+        computed (multi-threaded), otherwise the similarities of
+        SIMILARITY_BLOCK_SIZE queries at a time are computed to cap peak
+        memory. Blurbs share common terms, so each block of similarities is
+        dense and is computed straight into a dense array.
+
+        Args:
+            queries: l2 normalized tfidf matrix of the current scrape blurbs
+            postings: transposed l2 normalized tfidf matrix of the master list
+                blurbs, as csr, see DuplicateDetector._fit
+
+        Returns:
+            array with the highest similarity of each query
+    """
+    from numpy import zeros
+    from sklearn.utils.extmath import safe_sparse_dot
+
+    # tfidf rows are l2 normalized, so their dot product is cosine similarity
+    sp_matmul_topn = _load_sp_matmul_topn()
+    if sp_matmul_topn is None:
+        best = zeros(queries.shape[0])
+        for start in range(0, queries.shape[0], SIMILARITY_BLOCK_SIZE):
+            stop = start + SIMILARITY_BLOCK_SIZE
+            best[start:stop] = safe_sparse_dot(
+                queries[start:stop], postings, dense_output=True).max(axis=1)
+        return best
+
+    best = sp_matmul_topn(queries, postings, top_n=1,
+                          n_threads=os.cpu_count())
+    return best.max(axis=1).toarray().ravel()
+
+
+class DuplicateDetector(object):
+    """ Finds re-posts/duplicates of a reference corpus of jobs (i.e. the
+        master list) via tfidf cosine similarity.
+
+        The hashed term counts of the reference jobs are kept between calls,
+        keyed by job id and blurb digest, so updating the reference only
+        tokenizes jobs (or blurbs) that were not seen before, and the idf
+        weights are refit from the stored counts.
+    """
+
+    def __init__(self):
+        from sklearn.feature_extraction.text import TfidfTransformer
+
+        self.stopwords = _get_stopwords()
+        self.hasher = _blurb_hasher(self.stopwords)
+        self.transformer = TfidfTransformer()
+        # (job id, blurb digest) of the reference jobs, in the row order of
+        # reference_counts
+        self.reference_keys = []
+        self.reference_counts = None
+        # transposed tfidf of the reference jobs, see _fit
+        self.postings = None
+
+    @property
+    def reference_ids(self) -> List[str]:
+        """ Ids of the reference jobs, in the row order of reference_counts."""
+        return [job_id for job_id, _ in self.reference_keys]
+
+    def set_reference(self, jobs: Dict[str, dict]) -> bool:
+        """ Update the reference corpus to jobs, only hashing new jobs.
+
+            Args:
+                jobs: the existing master list job dict
+
+            Returns:
+                True if the reference corpus changed
+        """
+        from scipy.sparse import vstack as sp_vstack
+
+        reference_ids, reference_words = _ids_and_blurbs(jobs)
+        reference_keys = [(job_id, _blurb_digest(blurb)) for job_id, blurb
+                          in zip(reference_ids, reference_words)]
+        if frozenset(reference_keys) == frozenset(self.reference_keys):
+            return False
+
+        # reuse the term counts of jobs which are already in the reference
+        # with the same blurb, jobs with a changed blurb are hashed again
+        rows = {key: row for row, key in enumerate(self.reference_keys)}
+        kept_keys = [key for key in reference_keys if key in rows]
+        new_keys = [key for key in reference_keys if key not in rows]
+        new_words = [word for word, key in zip(reference_words, reference_keys)
+                     if key not in rows]
+
+        counts = []
+        if kept_keys:
+            counts.append(self.reference_counts[
+                [rows[key] for key in kept_keys]])
+        if new_words:
+            counts.append(self.hasher.transform(new_words))
+
+        self.reference_keys = kept_keys + new_keys
+        self.reference_counts = sp_vstack(counts).tocsr() if counts else None
+        self._fit()
+        return True
+
+    def find_duplicates(self, jobs: Dict[str, dict],
+                        max_similarity: float = 0.75) -> List[str]:
+        """ Find the jobs which are similar to any of the reference jobs.
+
+            Args:
+                jobs: today's job scrape dict
+                max_similarity: threshold above which blurb similarity =
+                    duplicate
+
+            Returns:
+                list of ids of the duplicate jobs
+        """
+        query_ids, query_words = _ids_and_blurbs(jobs)
+        if not query_words or self.postings is None:
+            return []
+
+        # loop over duplicates only
+        return [query_ids[row] for row in self.find_duplicate_rows(
+            self.hasher.transform(query_words), max_similarity)]
+
+    def find_duplicate_rows(self, counts, max_similarity: float = 0.75):
+        """ Find the rows of hashed term counts which are similar to any of
+            the reference jobs.
+
+            Args:
+                counts: term counts of today's jobs, as hashed by self.hasher
+                max_similarity: threshold above which blurb similarity =
+                    duplicate
+
+            Returns:
+                array of the rows of the duplicate jobs
+        """
+        from numpy import flatnonzero
+
+        if not counts.shape[0] or self.postings is None:
+            return []
+
+        # calculate best cosine similarity of blurbs to references
+        similarities = _max_similarities(self.transformer.transform(counts),
+                                         self.postings)
+        return flatnonzero(
+            similarities >= max_similarity - SIMILARITY_TOLERANCE)
+
+    def load_cache(self, cache_path: str) -> bool:
+        """ Load the reference corpus dumped by a previous run.
+
+            Args:
+                cache_path: pickle file written by dump_cache
+
+            Returns:
+                True if the cache was loaded
+        """
+        try:
+            if not os.path.isfile(cache_path):
+                return False
+            with open(cache_path, 'rb') as cache_file:
+                header, reference_keys, reference_counts = \
+                    pickle.load(cache_file)
+        except Exception as e:
+            logging.warning(f'unable to load tfidf cache {cache_path}: {e}')
+            return False
+        if header != self._cache_header():
+            return False
+
+        # rows whose blurb changed since are dropped by set_reference
+        self.reference_keys = reference_keys
+        self.reference_counts = reference_counts
+        self._fit()
+        return True
+
+    def dump_cache(self, cache_path: str):
+        """ Dump the reference corpus so the next run can reuse it. The cache
+            is optional, so failing to write it is only logged.
+
+            Args:
+                cache_path: pickle file to write
+        """
+        try:
+            with open(cache_path, 'wb') as cache_file:
+                pickle.dump((self._cache_header(), self.reference_keys,
+                             self.reference_counts), cache_file)
+        except OSError as e:
+            logging.warning(f'unable to write tfidf cache {cache_path}: {e}')
+
+    def _fit(self):
+        """ Refit the idf weights and the tfidf of the reference corpus."""
+        if self.reference_counts is None:
+            self.postings = None
+        else:
+            # rows of the transpose are postings lists, term -> references,
+            # converted to csr once here rather than by every product with it
+            self.postings = self.transformer.fit_transform(
+                self.reference_counts).T.tocsr()
+
+    def _cache_header(self) -> Dict[str, str]:
+        """ Identify what cached term counts are valid for."""
+        stopwords = '\n'.join(sorted(self.stopwords)).encode('utf8')
+        return {'version': str(TFIDF_CACHE_VERSION),
+                'stopwords': hashlib.sha1(stopwords).hexdigest()}
+
+
+def _pop_scrape_duplicates(cur_dict: Dict[str, dict], query_ids: List[str],
+                           counts, max_similarity: float) -> Dict[str, dict]:
+    """ Pop the re-posts/duplicates within the current scrape, in order, a job
+        is a duplicate if it is similar to a job not yet popped.
+
+        Args:
+            cur_dict: today's job scrape dict
+            query_ids: ids of the jobs in cur_dict, in the row order of counts
+            counts: term counts of the jobs, as hashed by _blurb_hasher
+            max_similarity: threshold above which blurb similarity = duplicate
+
+        Returns:
+            dict of the duplicate jobs which were removed from cur_dict
+    """
+    from numpy import arange, flatnonzero, zeros
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.utils.extmath import safe_sparse_dot
+
+    # init dict to store duplicates
+    duplicate_ids = {}
+
+    # the tfidf rows are l2 normalized so their dot product is the cosine
+    # similarity, the transpose is converted to csr once for all blocks
+    tfidf = TfidfTransformer().fit_transform(counts)
+    columns = tfidf.T.tocsr()
+    # identifies duplicates in order and stores them in duplicate ids
+    # dictionary, a job is a duplicate if it matches a job not yet popped
+    popped = zeros(len(query_ids), dtype=bool)
+    for start in range(0, len(query_ids), SIMILARITY_BLOCK_SIZE):
+        # blurbs share common terms, so the similarities of a block of jobs
+        # to all jobs are computed and thresholded as a dense (block, n) array
+        matches = safe_sparse_dot(
+            tfidf[start:start + SIMILARITY_BLOCK_SIZE], columns,
+            dense_output=True) >= max_similarity - SIMILARITY_TOLERANCE
+        # ignores the job itself, so whole dict does not get popped
+        rows = arange(matches.shape[0])
+        matches[rows, start + rows] = False
+        for offset in flatnonzero(matches.any(axis=1)):
+            if (matches[offset] & ~popped).any():
+                index = start + offset
+                popped[index] = True
+                duplicate_ids.update(
+                    {query_ids[index]: cur_dict.pop(query_ids[index])})
+    return duplicate_ids
+
+
+@lru_cache(maxsize=1)
+def _default_detector() -> DuplicateDetector:
+    """ Get the detector shared by all calls to tfidf_filter."""
+    return DuplicateDetector()
+
+
 def tfidf_filter(cur_dict: Dict[str, dict],
                  prev_dict: Optional[Dict[str, dict]] = None,
-                 max_similarity: float = 0.75):
+                 max_similarity: float = 0.75,
+                 cache_path: Optional[str] = None):
     """ Fit a tfidf vectorizer to a corpus of all listing's text.
 
         Args:
             cur_dict: today's job scrape dict
             prev_dict: the existing master list job dict
             max_similarity: threshold above which blurb similarity = duplicate
+            cache_path: pickle file to reuse the hashed prev_dict blurbs
+                across runs, only new prev_dict jobs are hashed
 
         Returns:
             list of duplicate job ids which were removed from cur_dict
     """
-    # retrieve stopwords if not already downloaded
-    try:
-        stopwords = nltk.corpus.stopwords.words('english')
-    except LookupError:
-        nltk.download('stopwords', quiet=True)
-        stopwords = nltk.corpus.stopwords.words('english')
+    # nothing to compare, no jobs were scraped
+    query_ids, query_words = _ids_and_blurbs(cur_dict)
+    if not query_words:
+        return {}
 
-    # init vectorizer
-    vectorizer = TfidfVectorizer(strip_accents='unicode', lowercase=True,
-                                 analyzer='word', stop_words=stopwords)
-
-    # init list to store duplicate ids
-    duplicate_ids = {}
+    # the scrape is hashed once, and its term counts used by both passes
+    counts = _blurb_hasher(_get_stopwords()).transform(query_words)
 
+    # checks current scrape for re-posts/duplicates
+    duplicate_ids = _pop_scrape_duplicates(cur_dict, query_ids, counts,
+                                           max_similarity)
     if prev_dict is None:
-        # get query words and ids as lists
-        query_ids = [job['id'] for job in cur_dict.values()]
-        query_words = [job['blurb'] for job in cur_dict.values()]
-
-        # returns cosine similarity between jobs as square matrix (n,n)
-        similarities = cosine_similarity(vectorizer.fit_transform(query_words))
-        # fills diagonals with 0, so whole dict does not get popped
-        fill_diagonal(similarities, 0)
-        # init index
-        index = 0
-        # identifies duplicates and stores them in duplicate ids dictionary
-        while True:
-            # loop breaks when index is equal to matrix height
-            if index == len(similarities):
-                break
-
-            # deletes row and column, every time a max is found for a job id
-            if np_max(similarities[index]) >= max_similarity:
-                # query ids are popped so index always matches correct element
-                duplicate_ids.update(
-                    {query_ids[index]: cur_dict.pop(query_ids.pop(index))})
-                # reduce matrix dimensions, (n-1, n-1)
-                similarities = np_delete(similarities, index, axis=0)
-                similarities = np_delete(similarities, index, axis=1)
-
-            else:  # increment index by one
-                index += 1
         # log something
         logging.info(f'Found and removed {len(duplicate_ids.keys())} '
                      f're-posts/duplicates via TFIDF cosine similarity!')
+        return duplicate_ids
 
-    else:
-        # checks current scrape for re-posts/duplicates
-        duplicate_ids = tfidf_filter(cur_dict)
+    # the detector keeps the master list tfidf between calls, a fresh
+    # detector picks up the master list hashed by the previous run
+    detector = _default_detector()
+    if cache_path is not None and not detector.reference_keys:
+        if detector.load_cache(cache_path):
+            logging.info(f'loaded tfidf of master list from {cache_path}')
+    changed = detector.set_reference(prev_dict)
+    if cache_path is not None and \
+            (changed or not os.path.isfile(cache_path)):
+        detector.dump_cache(cache_path)
 
-        # get query words and ids as lists
-        query_ids = [job['id'] for job in cur_dict.values()]
-        query_words = [job['blurb'] for job in cur_dict.values()]
+    # get duplicate job ids of the jobs left in the scrape and pop them
+    rows = [row for row, job_id in enumerate(query_ids) if job_id in cur_dict]
+    for row in detector.find_duplicate_rows(counts[rows], max_similarity):
+        query_id = query_ids[rows[row]]
+        duplicate_ids[query_id] = cur_dict.pop(query_id)
 
-        # get reference words as list
-        reference_words = [job['blurb'] for job in prev_dict.values()]
-
-        # fit vectorizer to entire corpus
-        vectorizer.fit(query_words + reference_words)
-
-        # set reference tfidf for cosine similarity later
-        references = vectorizer.transform(reference_words)
-
-        # calculate cosine similarity between reference and current blurbs
-        similarities = cosine_similarity(
-            vectorizer.transform(query_words), references)
-
-        # get duplicate job ids and pop them
-        for sim, query_id in zip(similarities, query_ids):
-            if np_max(sim) >= max_similarity:
-                duplicate_ids.update({query_id: cur_dict.pop(query_id)})
-
-        # log something
-        logging.info(f'found {len(cur_dict.keys())} unique listings and '
-                     f'{len(duplicate_ids.keys())} duplicates '
-                     f'via TFIDF cosine similarity')
+    # log something
+    logging.info(f'found {len(cur_dict.keys())} unique listings and '
+                 f'{len(duplicate_ids.keys())} duplicates '
+                 f'via TFIDF cosine similarity')
 
     # returns a dictionary of duplicates
     return duplicate_ids
@@ -33,6 +33,9 @@ def post_date_from_relative_post_age(job_list):
                   re.compile(r'[tT]oday|[jJ]ust [pP]osted'),
                   re.compile(r'[yY]esterday')]
 
+    # all post ages in the batch are relative to the same point in time
+    now = datetime.now()
+
     for job in job_list:
         if not job['date']:
             return job['date']
@@ -43,36 +46,36 @@ def post_date_from_relative_post_age(job_list):
         try:
             # hours old
             hours_ago = date_regex[0].findall(job['date'])[0]
-            post_date = datetime.now() - timedelta(hours=int(hours_ago))
+            post_date = now - timedelta(hours=int(hours_ago))
         except IndexError:
             # days old
             try:
                 days_ago = \
                     date_regex[1].findall(job['date'])[0]
-                post_date = datetime.now() - timedelta(days=int(days_ago))
+                post_date = now - timedelta(days=int(days_ago))
             except IndexError:
                 # months old
                 try:
                     months_ago = \
                         date_regex[2].findall(job['date'])[0]
-                    post_date = datetime.now() - relativedelta(
+                    post_date = now - relativedelta(
                         months=int(months_ago))
                 except IndexError:
                     # years old
                     try:
                         years_ago = \
                             date_regex[3].findall(job['date'])[0]
-                        post_date = datetime.now() - relativedelta(
+                        post_date = now - relativedelta(
                             years=int(years_ago))
                     except IndexError:
                         # try phrases like today, just posted, or yesterday
                         if date_regex[4].findall(
                                 job['date']) and not post_date:
                             # today
-                            post_date = datetime.now()
+                            post_date = now
                         elif date_regex[5].findall(job['date']):
                             # yesterday
-                            post_date = datetime.now() - timedelta(days=int(1))
+                            post_date = now - timedelta(days=int(1))
                         elif not post_date:
                             # must be from the 1970's
                             post_date = datetime(1970, 1, 1)
@@ -4,7 +4,9 @@ from collections import OrderedDict
 from datetime import datetime, timedelta
 from unittest.mock import patch
 
-from jobfunnel.tools.filters import tfidf_filter, id_filter, date_filter
+from jobfunnel.tools import filters
+from jobfunnel.tools.filters import tfidf_filter, id_filter, date_filter, \
+    DuplicateDetector
 
 
 attr_list = [[['blurb'], 'Looking for a passionate team player that is willing to learn new technologies. Our company X is still growing at an exponential rate. In order to be a perfect fit'
@@ -47,6 +49,34 @@ def test_tfidf_filter_no_previous_scrape(per_id_job_listings):
     assert list(new_job_listings) == ['1', '3']
 
 
+def test_tfidf_filter_counts_empty_blurbs(per_id_job_listings):
+    new_job_listings = per_id_job_listings(
+        [[['blurb'], 'developer senior developer developer'],
+         [['blurb'], 'team developer developer'], [['blurb'], '']])
+    tfidf_filter(new_job_listings)
+    # assert that the job without a blurb is kept and still counts towards
+    # the idf weights, which makes the first two jobs similar enough
+    assert list(new_job_listings) == ['1', '2']
+
+
+def test_tfidf_filter_keeps_exact_ties(per_id_job_listings):
+    new_job_listings = per_id_job_listings(
+        [[['blurb'], 'beta zeta'], [['blurb'], 'delta zeta'],
+         [['blurb'], 'beta delta']])
+    # every pair shares one of two equally weighted words, a similarity of
+    # exactly 0.5, so all but the last job are duplicates at 0.5
+    tfidf_filter(new_job_listings, max_similarity=0.5)
+    assert list(new_job_listings) == ['2']
+    new_job_listings = per_id_job_listings(
+        [[['blurb'], 'aws cloud data team']])
+    previous_job_listings = per_id_job_listings(
+        [[['blurb'], 'aws cloud data team'], [['blurb'], 'cloud team']],
+        first_job_id=1)
+    # assert that an identical blurb is a duplicate at max_similarity 1
+    tfidf_filter(new_job_listings, previous_job_listings, max_similarity=1.0)
+    assert len(new_job_listings) == 0
+
+
 def test_tfidf_filter_with_previous_scrape(per_id_job_listings):
     new_job_listings = per_id_job_listings([attr_list[0], attr_list[2]])
     # generate job listings with different job ids than new_job_listings
@@ -57,3 +87,86 @@ def test_tfidf_filter_with_previous_scrape(per_id_job_listings):
     assert len(new_job_listings) == 0
     # assert that the correct job ids are in the new filtered new_job_listings
     assert list(previous_job_listings) == ['2', '3']
+
+
+def test_tfidf_filter_reuses_cached_reference(per_id_job_listings, tmp_path):
+    cache_path = str(tmp_path / 'tfidf_cache.pkl')
+    previous_job_listings = per_id_job_listings(
+        [attr_list[1], attr_list[3]], first_job_id=2)
+    new_job_listings = per_id_job_listings([attr_list[0]])
+    tfidf_filter(new_job_listings, previous_job_listings,
+                 cache_path=cache_path)
+    # assert that a new detector picks up the cached previous job listings
+    detector = DuplicateDetector()
+    assert detector.load_cache(cache_path)
+    assert sorted(detector.reference_ids) == ['2', '3']
+    assert not detector.set_reference(previous_job_listings)
+    new_job_listings = per_id_job_listings([attr_list[2]])
+    assert detector.find_duplicates(new_job_listings) == ['0']
+
+
+def test_tfidf_filter_rehashes_changed_reference_blurbs(per_id_job_listings):
+    new_job_listings = per_id_job_listings([attr_list[0]])
+    previous_job_listings = per_id_job_listings([attr_list[1]], first_job_id=1)
+    tfidf_filter(new_job_listings, previous_job_listings)
+    assert len(new_job_listings) == 0
+    # same job id as before but with an unrelated blurb
+    new_job_listings = per_id_job_listings([attr_list[0]])
+    previous_job_listings = per_id_job_listings([attr_list[2]], first_job_id=1)
+    tfidf_filter(new_job_listings, previous_job_listings)
+    # assert that the changed blurb is used instead of the previous one
+    assert list(new_job_listings) == ['0']
+
+
+def test_duplicate_detector_drops_cached_changed_blurbs(per_id_job_listings,
+                                                        tmp_path):
+    cache_path = str(tmp_path / 'tfidf_cache.pkl')
+    detector = DuplicateDetector()
+    detector.set_reference(per_id_job_listings([attr_list[1]], first_job_id=1))
+    detector.dump_cache(cache_path)
+    # same job id as the cached one but with an unrelated blurb
+    detector = DuplicateDetector()
+    assert detector.load_cache(cache_path)
+    assert detector.set_reference(
+        per_id_job_listings([attr_list[2]], first_job_id=1))
+    # assert that the cached term counts of the old blurb are not used
+    assert detector.find_duplicates(per_id_job_listings([attr_list[0]])) == []
+
+
+def test_tfidf_filter_ignores_unwritable_cache(per_id_job_listings, tmp_path):
+    # the cache directory does not exist, so writing the cache fails
+    cache_path = str(tmp_path / 'missing' / 'tfidf_cache.pkl')
+    new_job_listings = per_id_job_listings([attr_list[0], attr_list[2]])
+    previous_job_listings = per_id_job_listings(
+        [attr_list[1], attr_list[3]], first_job_id=2)
+    tfidf_filter(new_job_listings, previous_job_listings,
+                 cache_path=cache_path)
+    # assert that the duplicates are still removed without raising
+    assert len(new_job_listings) == 0
+
+
+def test_duplicate_detector_only_hashes_new_references(per_id_job_listings):
+    detector = DuplicateDetector()
+    detector.set_reference(per_id_job_listings([attr_list[1]]))
+    previous_job_listings = per_id_job_listings([attr_list[1], attr_list[3]])
+    with patch.object(detector.hasher, 'transform',
+                      wraps=detector.hasher.transform) as transform:
+        assert detector.set_reference(previous_job_listings)
+    # assert that only the job listing which was not seen before is hashed
+    assert transform.call_args[0][0] == [attr_list[3][1]]
+    new_job_listings = per_id_job_listings([attr_list[0], attr_list[2]])
+    assert detector.find_duplicates(new_job_listings) == ['0', '1']
+
+
+def test_tfidf_filter_without_sparse_dot_topn(per_id_job_listings):
+    new_job_listings = per_id_job_listings(
+        [attr_list[0], attr_list[2], [['blurb'], 'Unrelated words only.']])
+    previous_job_listings = per_id_job_listings(
+        [attr_list[1], attr_list[3]], first_job_id=2)
+    # fall back to scipy sparse products when sparse_dot_topn is missing,
+    # one query at a time so that blocks are stitched back together
+    with patch.object(filters, '_load_sp_matmul_topn', return_value=None), \
+            patch.object(filters, 'SIMILARITY_BLOCK_SIZE', 1):
+        tfidf_filter(new_job_listings, previous_job_listings)
+    # assert that only the job listing sharing no words with them remains
+    assert list(new_job_listings) == ['2']
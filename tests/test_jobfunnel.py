@@ -0,0 +1,54 @@
+import pytest
+
+from jobfunnel.jobfunnel import JobFunnel
+
+
+blurbs = [[['blurb'], 'We make the best ice cream in the world. Our company still young and growing. The ideal candidate should like ice cream.'],
+          [['blurb'], 'We make the best ice cream in the world. Our company still young and growing. The ideal candidate should love ice cream.'],
+          [['blurb'], 'Looking for a passionate developer that is willing to learn new technologies and knows Python and SDLC.'],
+          ]
+
+
+@pytest.fixture()
+def init_jobfunnel(configure_options, per_id_job_listings, tmp_path):
+    def setup():
+        """
+        This function initializes a JobFunnel which saves duplicates to an
+        output directory under tmp_path, with a master list holding the first
+        job of blurbs and a duplicate list holding the last one.
+        """
+        jf = JobFunnel(configure_options(
+            ['', '-o', str(tmp_path), '--save_dup']))
+        jf.write_csv(data=per_id_job_listings([blurbs[0]]),
+                     path=jf.master_list_path)
+        jf.write_csv(data=per_id_job_listings([blurbs[2]], first_job_id=2),
+                     path=jf.duplicate_list_path)
+        # write the filter-list from the master list, as __main__ does
+        jf.update_filterjson()
+        return jf
+    return setup
+
+
+def test_update_masterlist_appends_new_duplicates(init_jobfunnel,
+                                                  per_id_job_listings):
+    jf = init_jobfunnel()
+    jf.scrape_data = per_id_job_listings([blurbs[1]], first_job_id=1)
+    jf.update_masterlist()
+    # assert that the new duplicate is appended after the saved one
+    assert list(jf.read_csv(jf.duplicate_list_path)) == ['2', '1']
+    assert list(jf.read_csv(jf.master_list_path)) == ['0']
+
+
+def test_update_masterlist_updates_saved_duplicates(init_jobfunnel,
+                                                    per_id_job_listings):
+    jf = init_jobfunnel()
+    jf.scrape_data = per_id_job_listings([blurbs[1]], first_job_id=1)
+    jf.update_masterlist()
+    # re-run on the same scrape with a changed title, as with --no_scrape
+    jf.scrape_data = per_id_job_listings([blurbs[1]], first_job_id=1)
+    jf.scrape_data['1']['title'] = 'Ice Cream Engineer'
+    jf.update_masterlist()
+    # assert that the saved duplicate is updated instead of added twice
+    duplicate_list = jf.read_csv(jf.duplicate_list_path, key_by_id=False)
+    assert [job['id'] for job in duplicate_list] == ['2', '1']
+    assert duplicate_list[1]['title'] == 'Ice Cream Engineer'